@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Throughput and page-cache footprint of the FileReaderWorker and
+FileWriterWorker transfer modes.  Every run starts with the file evicted
+from the page cache; "cached" is the share of the file still resident
+afterwards, as reported by mincore(2).
+
+    python bench/file_workers.py --size 1024 --dir /var/tmp | tee bench_output.txt
+"""
+
+import os
+import time
+import uuid
+import argparse
+
+from sabot import transfer
+from sabot import fileio
+
+ReaderModes = [
+    ("buffered", {}),
+    ("buffered+drop", {"drop_cache": True}),
+    ("mmap", {"mmap": True}),
+    ("mmap+drop", {"mmap": True, "drop_cache": True}),
+    ("direct", {"direct": True}),
+]
+
+WriterModes = [
+    ("buffered", {}),
+    ("buffered+drop", {"drop_cache": True}),
+    ("preallocate", {"preallocate": None}),
+    ("direct", {"direct": True}),
+]
+
+class NullPipe(object):
+    def write(self, data):
+        pass
+
+class RepeatPipe(object):
+    def __init__(self, chunk, size):
+        self.chunk = chunk
+        self.remaining = size
+
+    def read(self, bufsize=None):
+        if self.remaining <= 0:
+            return b""
+        data = self.chunk[:self.remaining]
+        self.remaining -= len(data)
+        return data
+
+def evict(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        fileio.fadvise(fd, 0, 0, fileio.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+def cached_share(path):
+    pages = fileio.cached_pages(path)
+    if pages == None or not pages[1]:
+        return "n/a"
+    return "%5.1f%%" % (100.0 * pages[0] / pages[1])
+
+def report(kind, name, worker, size, elapsed, path):
+    rate = size / float(2 ** 20) / elapsed
+    print("%-6s %-14s %-9s %9.1f MiB/s  cached %s" % (kind, name, worker.transfer_mode, rate, cached_share(path)))
+
+def bench_readers(path, size, bufsize):
+    for (name, kw) in ReaderModes:
+        evict(path)
+        worker = transfer.FileReaderWorker(path=path, bufsize=bufsize, **kw)
+        worker.endpoint_bind(write=NullPipe())
+        start = time.time()
+        worker.transfer()
+        report("read", name, worker, size, time.time() - start, path)
+
+def bench_writers(path, size, bufsize):
+    chunk = os.urandom(bufsize)
+    for (name, kw) in WriterModes:
+        kw = dict(kw)
+        if "preallocate" in kw:
+            kw["preallocate"] = size
+        worker = transfer.FileWriterWorker(path=path, bufsize=bufsize, **kw)
+        worker.endpoint_bind(read=RepeatPipe(chunk, size))
+        start = time.time()
+        worker.transfer()
+        # count writeback too, otherwise buffered modes only measure memcpy
+        fd = os.open(path, os.O_RDONLY)
+        os.fsync(fd)
+        os.close(fd)
+        report("write", name, worker, size, time.time() - start, path)
+        os.unlink(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--size", type=int, default=256, help="file size in MiB")
+    parser.add_argument("--bufsize", type=int, default=2 ** 16, help="worker buffer size in bytes")
+    parser.add_argument("--dir", default="/var/tmp", help="directory on the filesystem under test")
+    args = parser.parse_args()
+    size = args.size * 2 ** 20
+    path = os.path.join(args.dir, "sabot-bench-%s" % str(uuid.uuid4()).split('-')[0])
+    try:
+        with open(path, "wb") as fh:
+            chunk = os.urandom(2 ** 20)
+            for idx in range(args.size):
+                fh.write(chunk)
+        bench_readers(path, size, args.bufsize)
+        os.unlink(path)
+        bench_writers(path, size, args.bufsize)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+if __name__ == "__main__":
+    main()
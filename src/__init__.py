@@ -1 +1,17 @@
-from . session import resource, client
+# boto3 is only imported once a session is actually needed
+
+def get_session(*args, **kw):
+    from . import session
+    return session.get_session(*args, **kw)
+
+def resource(*args, **kw):
+    from . import session
+    return session.resource(*args, **kw)
+
+def client(*args, **kw):
+    from . import session
+    return session.client(*args, **kw)
+
+def prewarm(*args, **kw):
+    from . import session
+    return session.prewarm(*args, **kw)
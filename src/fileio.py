@@ -0,0 +1,168 @@
+import os
+import sys
+import mmap
+import ctypes
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+__all__ = ["AlignedBuffer", "align", "fadvise", "fallocate", "cached_pages"]
+
+LINUX = sys.platform.startswith("linux")
+
+# python 2 lacks these in the os module, their values are fixed on linux
+O_DIRECT = getattr(os, "O_DIRECT", 0)
+POSIX_FADV_SEQUENTIAL = getattr(os, "POSIX_FADV_SEQUENTIAL", 2 if LINUX else None)
+POSIX_FADV_DONTNEED = getattr(os, "POSIX_FADV_DONTNEED", 4 if LINUX else None)
+
+PROT_READ = getattr(mmap, "PROT_READ", 1)
+MAP_SHARED = getattr(mmap, "MAP_SHARED", 1)
+
+libc = None
+def _bootstrap():
+    # resolved on first use so importing sabot never pays for it
+    global libc
+    if libc != None:
+        return libc
+    libc = {}
+    if os.name != "posix":
+        return libc
+    try:
+        lib = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return libc
+    prototypes = {
+        "read": (ctypes.c_ssize_t, [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]),
+        "write": (ctypes.c_ssize_t, [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]),
+        "posix_fadvise": (ctypes.c_int, [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_int]),
+        "posix_fallocate": (ctypes.c_int, [ctypes.c_int, ctypes.c_int64, ctypes.c_int64]),
+        "mmap": (ctypes.c_void_p, [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int64]),
+        "munmap": (ctypes.c_int, [ctypes.c_void_p, ctypes.c_size_t]),
+        "mincore": (ctypes.c_int, [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]),
+    }
+    for (name, (restype, argtypes)) in prototypes.items():
+        # prefer the 64-bit offset variants where libc has them
+        func = getattr(lib, name + "64", None) or getattr(lib, name, None)
+        if func == None:
+            continue
+        func.restype = restype
+        func.argtypes = argtypes
+        libc[name] = func
+    return libc
+
+def _libc_function(name):
+    return _bootstrap().get(name)
+
+def _raise_errno(err=None):
+    err = err if err != None else ctypes.get_errno()
+    raise OSError(err, os.strerror(err))
+
+def align(size, alignment=mmap.PAGESIZE):
+    return ((size + alignment - 1) // alignment) * alignment
+
+def fadvise_supported():
+    return POSIX_FADV_DONTNEED != None and (hasattr(os, "posix_fadvise") or _libc_function("posix_fadvise") != None)
+
+def fadvise(fd, offset, length, advice):
+    """
+    Apply a posix_fadvise hint, returning False when the platform has none.
+    """
+    if advice == None:
+        return False
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, offset, length, advice)
+        return True
+    func = _libc_function("posix_fadvise")
+    if func == None:
+        return False
+    err = func(fd, offset, length, advice)
+    if err:
+        _raise_errno(err)
+    return True
+
+def fallocate_supported():
+    return hasattr(os, "posix_fallocate") or _libc_function("posix_fallocate") != None
+
+def fallocate(fd, offset, length):
+    """
+    Reserve disk blocks for a file, returning False when unsupported.
+    """
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, offset, length)
+        return True
+    func = _libc_function("posix_fallocate")
+    if func == None:
+        return False
+    err = func(fd, offset, length)
+    if err:
+        _raise_errno(err)
+    return True
+
+def direct_supported():
+    return bool(O_DIRECT and fcntl and _libc_function("read") and _libc_function("write"))
+
+def clear_direct(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~O_DIRECT)
+
+class AlignedBuffer(object):
+    """
+    Page-aligned buffer for O_DIRECT io.  Reads and writes go straight
+    through libc so they work the same on python 2 and 3.
+    """
+
+    def __init__(self, size, alignment=mmap.PAGESIZE):
+        self.size = align(size, alignment)
+        self.raw = ctypes.create_string_buffer(self.size + alignment)
+        base = ctypes.addressof(self.raw)
+        self.address = base + (-base % alignment)
+
+    def readfrom(self, fd):
+        sz = _libc_function("read")(fd, self.address, self.size)
+        if sz < 0:
+            _raise_errno()
+        return sz
+
+    def writeto(self, fd, length):
+        offset = 0
+        while offset < length:
+            sz = _libc_function("write")(fd, self.address + offset, length - offset)
+            if sz < 0:
+                _raise_errno()
+            offset += sz
+
+    def put(self, offset, data):
+        ctypes.memmove(self.address + offset, data, len(data))
+
+    def getvalue(self, length):
+        return ctypes.string_at(self.address, length)
+
+def cached_pages(path):
+    """
+    Return (cached, total) page counts for a file using mincore(2), or None
+    where that isn't available.
+    """
+    func = _libc_function("mincore")
+    if func == None:
+        return None
+    size = os.stat(path).st_size
+    pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    if not pages:
+        return (0, 0)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = _libc_function("mmap")(None, size, PROT_READ, MAP_SHARED, fd, 0)
+        if addr == None or addr == ctypes.c_void_p(-1).value:
+            _raise_errno()
+        try:
+            vec = (ctypes.c_ubyte * pages)()
+            if func(addr, size, vec):
+                _raise_errno()
+            cached = sum(1 for page in vec if page & 1)
+        finally:
+            _libc_function("munmap")(addr, size)
+    finally:
+        os.close(fd)
+    return (cached, pages)
@@ -69,7 +69,7 @@ class SabotBucket(SabotHook):
                 yield self.meta.resource.Object(Bucket=self.name, Key=key)
     __iter__ = list_objects
 
-def get_hooks():
+def _discover_hooks():
     this = sys.modules[__name__]
     for (name, obj) in inspect.getmembers(this):
         if not inspect.isclass(obj):
@@ -79,3 +79,10 @@ def get_hooks():
         if obj.EventHook == None:
             continue
         yield (obj.EventHook, obj.install_hook)
+
+hooks = None
+def get_hooks():
+    global hooks
+    if hooks == None:
+        hooks = list(_discover_hooks())
+    return hooks
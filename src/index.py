@@ -0,0 +1,260 @@
+import os
+import sys
+import mmap
+import stat
+import struct
+import shutil
+import heapq
+import tempfile
+import collections
+
+from . import log
+
+logger = log.get_logger(__name__)
+
+__all__ = ["ManifestEntry", "ManifestIndex", "IncrementalManifest"]
+
+ManifestEntry = collections.namedtuple("ManifestEntry", ["path", "size", "mtime", "inode", "mode"])
+
+Header = struct.Struct("<8sQI")
+Record = struct.Struct("<HQqQI")
+Field = struct.Struct("<i")
+MAGIC = b"SABOTIDX"
+
+def fsencode(path):
+    if isinstance(path, bytes):
+        return path
+    if hasattr(os, "fsencode"):
+        return os.fsencode(path)
+    return path.encode(sys.getfilesystemencoding())
+
+def fsdecode(path):
+    # native str paths: bytes on python 2, surrogate-escaped text on python 3
+    if str is bytes:
+        return path
+    return os.fsdecode(path)
+
+def pack_meta(values):
+    # paths are stored as raw filesystem bytes so they round-trip on either python
+    buf = []
+    for value in values:
+        if value == None:
+            buf.append(Field.pack(-1))
+        else:
+            value = fsencode(value)
+            buf.append(Field.pack(len(value)) + value)
+    return b"".join(buf)
+
+def unpack_meta(buf, count):
+    values = []
+    offset = 0
+    for idx in range(count):
+        (length,) = Field.unpack_from(buf, offset)
+        offset += Field.size
+        if length < 0:
+            values.append(None)
+            continue
+        values.append(fsdecode(buf[offset:offset + length]))
+        offset += length
+    return values
+
+def sort_key(path):
+    # order by path component so a directory always precedes its contents
+    return path.replace(b"/", b"\x00")
+
+def pack_entry(entry):
+    return Record.pack(len(entry.path), entry.size, entry.mtime, entry.inode, entry.mode) + entry.path
+
+def read_entries(fh):
+    while 1:
+        header = fh.read(Record.size)
+        if not header:
+            break
+        (pathlen, size, mtime, inode, mode) = Record.unpack(header)
+        yield ManifestEntry(fh.read(pathlen), size, mtime, inode, mode)
+
+def stat_entry(path, relpath):
+    st = os.lstat(path)
+    mtime = getattr(st, "st_mtime_ns", None)
+    if mtime == None:
+        mtime = int(st.st_mtime * 1e9)
+    size = st.st_size if stat.S_ISREG(st.st_mode) else 0
+    return ManifestEntry(fsencode(relpath), size, mtime, st.st_ino, st.st_mode)
+
+class ManifestIndex(object):
+    """
+    Sorted, deduplicated and memory-mapped record file describing a
+    Manifest.  Entries are packed as path/size/mtime/inode/mode records so a
+    tree of tens of millions of paths costs disk, not heap.  Iterating
+    yields (path, arcname) in path order, like a Manifest.
+    """
+
+    def __init__(self, filename, delete=False):
+        self.filename = filename
+        self.delete = delete
+        with open(filename, "rb") as fh:
+            (magic, self.count, metalen) = Header.unpack(fh.read(Header.size))
+            if magic != MAGIC:
+                raise ValueError("not a manifest index: %s" % filename)
+            meta = fh.read(metalen)
+        self.data_offset = Header.size + metalen
+        (self.root, self.relpath, self.arcpath) = unpack_meta(meta, 3)
+
+    @classmethod
+    def build(cls, manifest, filename=None, chunk_size=2 ** 20, tmpdir=None):
+        """
+        Walk `manifest` and write its index to `filename` with an external
+        merge sort, holding at most `chunk_size` entries in memory.  Without
+        a filename the index lives in a temporary file removed on close().
+        """
+        root = manifest.path
+        if not os.path.isdir(root):
+            root = os.path.dirname(root)
+        spill_dir = tempfile.mkdtemp(prefix="sabot-index-", dir=tmpdir)
+        delete = filename == None
+        if delete:
+            (fd, filename) = tempfile.mkstemp(prefix="sabot-index-", dir=tmpdir)
+            os.close(fd)
+        try:
+            runs = []
+            chunk = []
+            for (path, arcname) in manifest:
+                try:
+                    entry = stat_entry(path, os.path.relpath(path, root))
+                except OSError:
+                    logger.warning("skipping vanished path %s" % path)
+                    continue
+                chunk.append(entry)
+                if len(chunk) >= chunk_size:
+                    runs.append(cls._spill(chunk, spill_dir))
+                    chunk = []
+            if chunk or not runs:
+                runs.append(cls._spill(chunk, spill_dir))
+            meta = pack_meta([root, manifest.relpath, manifest.arcpath])
+            cls._merge(runs, filename, meta)
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        return cls(filename, delete=delete)
+
+    @staticmethod
+    def _spill(chunk, spill_dir):
+        chunk.sort(key=lambda entry: sort_key(entry.path))
+        (fd, runfn) = tempfile.mkstemp(dir=spill_dir)
+        with os.fdopen(fd, "wb") as fh:
+            for entry in chunk:
+                fh.write(pack_entry(entry))
+        return runfn
+
+    @staticmethod
+    def _merge(runs, filename, meta):
+        handles = [open(runfn, "rb", 2 ** 16) for runfn in runs]
+        try:
+            streams = [((sort_key(entry.path), entry) for entry in read_entries(fh)) for fh in handles]
+            count = 0
+            last = None
+            with open(filename, "wb") as out:
+                out.write(Header.pack(MAGIC, 0, len(meta)))
+                out.write(meta)
+                for (key, entry) in heapq.merge(*streams):
+                    if key == last:
+                        continue
+                    last = key
+                    out.write(pack_entry(entry))
+                    count += 1
+                out.seek(0)
+                out.write(Header.pack(MAGIC, count, len(meta)))
+        finally:
+            for fh in handles:
+                fh.close()
+
+    def close(self):
+        if self.delete and os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        # an index of an empty tree is still a manifest, unlike an empty container
+        return True
+    __nonzero__ = __bool__
+
+    def entries(self):
+        with open(self.filename, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = self.data_offset
+            end = len(mm)
+            while offset < end:
+                (pathlen, size, mtime, inode, mode) = Record.unpack_from(mm, offset)
+                offset += Record.size
+                path = mm[offset:offset + pathlen]
+                offset += pathlen
+                yield ManifestEntry(path, size, mtime, inode, mode)
+        finally:
+            mm.close()
+
+    def get_path(self, entry):
+        return os.path.join(self.root, fsdecode(entry.path))
+
+    def arcname(self, path):
+        if self.relpath:
+            path = os.path.relpath(path, self.relpath)
+        if self.arcpath:
+            path = os.path.join(self.arcpath, path)
+        return path
+
+    def get_size(self):
+        return sum(entry.size for entry in self.entries())
+
+    def diff(self, other):
+        """
+        Stream the differences between this index and an older one as
+        (state, entry) pairs in path order, where state is "added",
+        "removed" or "modified".  Removed entries come from `other`.
+        """
+        new = self.entries()
+        old = other.entries()
+        new_entry = next(new, None)
+        old_entry = next(old, None)
+        while new_entry != None or old_entry != None:
+            if old_entry == None:
+                order = -1
+            elif new_entry == None:
+                order = 1
+            else:
+                new_key = sort_key(new_entry.path)
+                old_key = sort_key(old_entry.path)
+                order = (new_key > old_key) - (new_key < old_key)
+            if order < 0:
+                yield ("added", new_entry)
+                new_entry = next(new, None)
+            elif order > 0:
+                yield ("removed", old_entry)
+                old_entry = next(old, None)
+            else:
+                if (new_entry.size, new_entry.mtime, new_entry.mode) != (old_entry.size, old_entry.mtime, old_entry.mode):
+                    yield ("modified", new_entry)
+                new_entry = next(new, None)
+                old_entry = next(old, None)
+
+    def __iter__(self):
+        for entry in self.entries():
+            path = self.get_path(entry)
+            yield (path, self.arcname(path))
+
+class IncrementalManifest(object):
+    """
+    Manifest of the paths added or modified in `index` since `base`.
+    """
+
+    def __init__(self, index, base):
+        self.index = index
+        self.base = base
+
+    def __iter__(self):
+        for (state, entry) in self.index.diff(self.base):
+            if state == "removed":
+                continue
+            path = self.index.get_path(entry)
+            yield (path, self.index.arcname(path))
@@ -1,11 +1,15 @@
+import os
 import boto3
 from . hooks import get_hooks
 
-__all__ = ["get_session"]
+__all__ = ["get_session", "prewarm"]
 
 class SessionManager(object):
     DefaultSessionName = "__default__"
+    # keyed by pid: boto3 sessions and clients must not be shared across a fork
     Sessions = {}
+    Clients = {}
+    Resources = {}
 
     def _build_session(self):
         session = boto3.Session()
@@ -15,17 +19,29 @@ class SessionManager(object):
 
     def get_session(self, name=None):
         name = name if name != None else self.DefaultSessionName
-        if name not in self.Sessions:
-            self.Sessions[name] = self._build_session()
-        return self.Sessions[name]
+        key = (os.getpid(), name)
+        if key not in self.Sessions:
+            self.Sessions[key] = self._build_session()
+        return self.Sessions[key]
 
-    def resource(self, name):
-        session = get_session()
-        return session.resource(name)
+    def resource(self, name, endpoint_url=None, region_name=None):
+        key = (os.getpid(), self.DefaultSessionName, name, endpoint_url, region_name)
+        if key not in self.Resources:
+            session = get_session()
+            self.Resources[key] = session.resource(name, endpoint_url=endpoint_url, region_name=region_name)
+        return self.Resources[key]
 
-    def client(self, name):
-        session = get_session()
-        return session.client(name)
+    def client(self, name, endpoint_url=None, region_name=None):
+        key = (os.getpid(), self.DefaultSessionName, name, endpoint_url, region_name)
+        if key not in self.Clients:
+            session = get_session()
+            self.Clients[key] = session.client(name, endpoint_url=endpoint_url, region_name=region_name)
+        return self.Clients[key]
+
+    def prewarm(self, services=("s3",)):
+        for name in services:
+            self.client(name)
+            self.resource(name)
 
 def get_session(*args, **kw):
     sm = SessionManager()
@@ -39,6 +55,10 @@ def client(*args, **kw):
     sm = SessionManager()
     return sm.client(*args, **kw)
 
+def prewarm(*args, **kw):
+    sm = SessionManager()
+    return sm.prewarm(*args, **kw)
+
 def bind_session(target):
     def bind_target(*args, **kw):
         #defs = dict(zip(target.func_code.co_varnames[::-1], target.func_defaults[::-1]))
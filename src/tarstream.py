@@ -0,0 +1,184 @@
+import os
+import sys
+import copy
+import errno
+import hashlib
+import tarfile
+import collections
+
+__all__ = ["ContentIndex", "SparseReader", "add_sparse", "sparse_map"]
+
+LINUX = sys.platform.startswith("linux")
+
+# python 2 lacks these in the os module, their values are fixed on linux
+SEEK_DATA = getattr(os, "SEEK_DATA", 3 if LINUX else None)
+SEEK_HOLE = getattr(os, "SEEK_HOLE", 4 if LINUX else None)
+
+# old GNU sparse headers: 4 map entries in the member header, 21 per extension block
+SPARSE_HEADER_ENTRIES = 4
+SPARSE_EXTENDED_ENTRIES = 21
+
+def sparse_map(fd, st):
+    """
+    Return the (offset, length) data segments of a sparse file, or None
+    when the file has no holes worth recording.
+    """
+    if SEEK_DATA == None or SEEK_HOLE == None:
+        return None
+    blocks = getattr(st, "st_blocks", None)
+    if blocks == None or blocks * 512 >= st.st_size:
+        return None
+    segments = []
+    offset = 0
+    try:
+        while offset < st.st_size:
+            try:
+                data = os.lseek(fd, offset, SEEK_DATA)
+            except OSError as err:
+                # ENXIO: nothing but a hole from offset to the end
+                if err.errno != errno.ENXIO:
+                    raise
+                break
+            hole = os.lseek(fd, data, SEEK_HOLE)
+            segments.append((data, hole - data))
+            offset = hole
+    except OSError as err:
+        if err.errno == errno.EINVAL:
+            # filesystem doesn't support hole detection
+            return None
+        raise
+    finally:
+        os.lseek(fd, 0, os.SEEK_SET)
+    if not segments or segments[-1][0] + segments[-1][1] < st.st_size:
+        # a trailing hole is marked by an empty segment at the real size
+        segments.append((st.st_size, 0))
+    return segments
+
+def _sparse_entries(segments):
+    buf = bytearray()
+    for (offset, length) in segments:
+        buf += bytearray(tarfile.itn(offset, 12, tarfile.GNU_FORMAT))
+        buf += bytearray(tarfile.itn(length, 12, tarfile.GNU_FORMAT))
+    return buf
+
+def _set_checksum(header):
+    chksum = 256 + sum(header[:148]) + sum(header[156:512])
+    header[148:155] = bytearray(("%06o" % chksum).encode("ascii") + b"\0")
+
+def sparse_headers(tarinfo, segments, encoding, errors):
+    """
+    Build the old GNU sparse ("S") header blocks for `tarinfo`.  Unlike the
+    PAX sparse formats these are read by GNU tar and by tarfile on both
+    python 2 and 3.
+    """
+    member = copy.copy(tarinfo)
+    member.type = tarfile.GNUTYPE_SPARSE
+    member.size = sum(length for (offset, length) in segments)
+    buf = bytearray(member.tobuf(tarfile.GNU_FORMAT, encoding, errors))
+    header = buf[-tarfile.BLOCKSIZE:]
+    head = segments[:SPARSE_HEADER_ENTRIES]
+    rest = segments[SPARSE_HEADER_ENTRIES:]
+    header[386:386 + 24 * len(head)] = _sparse_entries(head)
+    header[482] = 1 if rest else 0
+    header[483:495] = bytearray(tarfile.itn(tarinfo.size, 12, tarfile.GNU_FORMAT))
+    _set_checksum(header)
+    buf[-tarfile.BLOCKSIZE:] = header
+    while rest:
+        block = bytearray(tarfile.BLOCKSIZE)
+        chunk = rest[:SPARSE_EXTENDED_ENTRIES]
+        rest = rest[SPARSE_EXTENDED_ENTRIES:]
+        block[:24 * len(chunk)] = _sparse_entries(chunk)
+        block[504] = 1 if rest else 0
+        buf += block
+    return (member, bytes(buf))
+
+def add_sparse(tf, tarinfo, fh, segments):
+    """
+    Append a sparse member holding only the data segments of `fh`.
+    """
+    (member, header) = sparse_headers(tarinfo, segments, tf.encoding, tf.errors)
+    tf.fileobj.write(header)
+    tf.offset += len(header)
+    tarfile.copyfileobj(SparseReader(fh, segments), tf.fileobj, member.size)
+    (blocks, remainder) = divmod(member.size, tarfile.BLOCKSIZE)
+    if remainder:
+        tf.fileobj.write(b"\0" * (tarfile.BLOCKSIZE - remainder))
+        blocks += 1
+    tf.offset += blocks * tarfile.BLOCKSIZE
+    tf.members.append(member)
+
+class SparseReader(object):
+    """
+    File-like object yielding only the data segments of a sparse file.
+    """
+
+    def __init__(self, fh, segments):
+        self.fh = fh
+        self.segments = collections.deque(segments)
+        self.remaining = 0
+
+    def read(self, size=-1):
+        # tarfile treats a short read as truncated data, so always fill the request
+        if size < 0:
+            size = sys.maxsize
+        chunks = []
+        while size > 0:
+            data = self._read(size)
+            if not data:
+                break
+            chunks.append(data)
+            size -= len(data)
+        return b"".join(chunks)
+
+    def _read(self, size):
+        while not self.remaining:
+            if not self.segments:
+                return b""
+            (offset, length) = self.segments.popleft()
+            self.fh.seek(offset)
+            self.remaining = length
+        data = self.fh.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+class ContentIndex(object):
+    """
+    Finds files whose content was already archived.  Files are grouped by
+    size and only hashed once a second file of the same size shows up.
+    Memory grows with the number of distinct (size, digest) pairs, not
+    with the number of files.
+    """
+
+    def __init__(self, bufsize=2 ** 16):
+        self.bufsize = bufsize
+        # first (path, arcname) of each size, None once it has been hashed
+        self.pending = {}
+        self.digests = {}
+
+    def digest(self, path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as fh:
+            while 1:
+                data = fh.read(self.bufsize)
+                if not data:
+                    break
+                sha.update(data)
+        return sha.digest()
+
+    def match(self, path, arcname, size):
+        """
+        Return the arcname of an earlier file with identical content, or
+        record this one and return None.
+        """
+        if size not in self.pending:
+            self.pending[size] = (path, arcname)
+            return None
+        first = self.pending[size]
+        if first != None:
+            self.digests.setdefault((size, self.digest(first[0])), first[1])
+            self.pending[size] = None
+        key = (size, self.digest(path))
+        if key in self.digests:
+            return self.digests[key]
+        self.digests[key] = arcname
+        return None
@@ -8,8 +8,19 @@ import zlib
 import bz2
 import sys
 import itertools
+import errno
+import mmap
+import io
+import stat
+import shutil
+import tempfile
+import collections
+import zipfile
 
 from . import log
+from . import zipstream
+from . import tarstream
+from . import fileio
 
 logger = log.get_logger(__name__)
 
@@ -42,6 +53,10 @@ class Manifest(object):
             path = os.path.join(self.arcpath, path)
         return path
 
+    def index(self, *args, **kw):
+        from . import index
+        return index.ManifestIndex.build(self, *args, **kw)
+
     def __iter__(self):
         for path in self.walk():
             if self.callback and not self.callback(path):
@@ -185,8 +200,14 @@ class Endpoint(object):
         return data
 
 class TransferWorker(Endpoint, multiprocessing.Process):
+    # random access workers fetch their own input instead of reading a pipe
+    RandomAccess = False
+
     Defaults = {
         "bufsize": 2 ** 16,
+        "daemon": True,
+        # callable run at the start of the worker process, e.g. sabot.prewarm
+        "prewarm": None,
     }
 
     def __init__(self, **kw):
@@ -211,12 +232,13 @@ class TransferWorker(Endpoint, multiprocessing.Process):
         return defaults
 
     def start(self):
-        self.daemon = True
         self.transfer_count = 0
         super(TransferWorker, self).start()
 
     def run(self):
         #print "%s: running" % self.name
+        if self.prewarm:
+            self.prewarm()
         self.endpoint_init()
         try:
             self.transfer()
@@ -239,12 +261,45 @@ class UriSource(TransferWorker):
 class TarArchive(TransferWorker):
     Defaults = {
         "manifest": None,
+        "sparse": True,
+        # identical files are stored as hardlinks, and extract as hardlinks;
+        # costs one digest and arcname per distinct file content for the whole run
+        "dedupe": False,
+        "dedupe_min_size": 2 ** 12,
     }
 
     def transfer(self):
+        # the manifest already lists every path, so never let tarfile recurse
         tf = tarfile.TarFile.open(mode='w|', fileobj=self.pipe_write)
+        content = tarstream.ContentIndex(self.bufsize) if self.dedupe else None
         for (path, arcname) in self.manifest:
-            tf.add(path, arcname=arcname)
+            # gettarinfo turns repeat inodes into hardlinks on its own
+            tarinfo = tf.gettarinfo(path, arcname=arcname)
+            if tarinfo == None:
+                logger.warning("skipping unsupported file type %s" % path)
+                continue
+            if tarinfo.isreg():
+                self.add_file(tf, tarinfo, path, content)
+            else:
+                tf.addfile(tarinfo)
+        tf.close()
+
+    def add_file(self, tf, tarinfo, path, content):
+        if content != None and tarinfo.size >= self.dedupe_min_size:
+            linkname = content.match(path, tarinfo.name, tarinfo.size)
+            if linkname != None:
+                tarinfo.type = tarfile.LNKTYPE
+                tarinfo.linkname = linkname
+                tarinfo.size = 0
+                tf.addfile(tarinfo)
+                return
+        with open(path, "rb") as fh:
+            if self.sparse:
+                segments = tarstream.sparse_map(fh.fileno(), os.fstat(fh.fileno()))
+                if segments:
+                    tarstream.add_sparse(tf, tarinfo, fh, segments)
+                    return
+            tf.addfile(tarinfo, fh)
 
 class TarExtract(TransferWorker):
     Defaults = {
@@ -256,6 +311,264 @@ class TarExtract(TransferWorker):
         tf = tarfile.TarFile.open(mode='r|', fileobj=self.pipe_read)
         tf.extractall(path=self.path)
 
+def within(root, path):
+    root = os.path.realpath(root)
+    path = os.path.realpath(path)
+    return path == root or path.startswith(os.path.join(root, ""))
+
+def member_target(path, name):
+    """
+    Return where zipfile extracts member `name` under `path`, or None when
+    a symlinked parent directory or the resolved target would put it
+    outside of `path`.
+    """
+    # the same sanitizing zipfile applies to member names
+    parts = [part for part in name.split("/") if part not in ("", os.curdir, os.pardir)]
+    if not parts:
+        return None
+    parent = path
+    for part in parts[:-1]:
+        parent = os.path.join(parent, part)
+        if os.path.islink(parent):
+            return None
+    target = os.path.join(parent, parts[-1])
+    if not within(path, target):
+        return None
+    return target
+
+def extract_members(source, names, path):
+    zf = zipfile.ZipFile(open_source(source))
+    try:
+        for name in names:
+            if member_target(path, name) == None:
+                logger.warning("refusing zip member outside %s: %s" % (path, name))
+                continue
+            info = zf.getinfo(name)
+            target = extract_member(zf, info, path)
+            mode = stat.S_IMODE(info.external_attr >> 16)
+            if mode:
+                os.chmod(target, mode)
+    finally:
+        zf.close()
+
+def extract_symlinks(links, path):
+    created = []
+    for (name, linkname) in links:
+        target = member_target(path, name)
+        if target == None or os.path.isabs(linkname) or not within(path, os.path.join(os.path.dirname(target), linkname)):
+            logger.warning("refusing zip symlink outside %s: %s -> %s" % (path, name, linkname))
+            continue
+        if os.path.islink(target):
+            os.unlink(target)
+        try:
+            os.symlink(linkname, target)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+            logger.warning("not replacing %s with a symlink" % target)
+            continue
+        created.append(target)
+    # a later link can change where an earlier one resolves, so check them all again
+    for target in created:
+        if not within(path, target):
+            logger.warning("removing zip symlink resolving outside %s: %s" % (path, target))
+            os.unlink(target)
+
+def extract_member(zf, info, path):
+    # zipfile's makedirs has no exist_ok, so a sibling pool worker can win the race
+    for attempt in range(info.filename.count("/")):
+        try:
+            return zf.extract(info, path=path)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+    return zf.extract(info, path=path)
+
+def s3_endpoint(s3obj):
+    # worker processes build their own clients, so carry over where the caller's points
+    meta = s3obj.meta.client.meta
+    return {"endpoint_url": meta.endpoint_url, "region_name": meta.region_name}
+
+def open_source(source):
+    if source[0] == "s3":
+        # the pool child needs its own client, connections don't survive fork
+        from . import session
+        (kind, bucket, key, range_size, endpoint) = source
+        raw = S3RangeReader(session.client("s3", **endpoint), bucket, key)
+        return io.BufferedReader(raw, buffer_size=range_size)
+    return open(source[1], "rb")
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Read-only, seekable view of an S3 object backed by ranged GETs.
+    """
+
+    def __init__(self, client, bucket, key):
+        super(S3RangeReader, self).__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buf):
+        if self.position >= self.size or not len(buf):
+            return 0
+        end = min(self.position + len(buf), self.size) - 1
+        byterange = "bytes=%d-%d" % (self.position, end)
+        resp = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=byterange)
+        data = resp["Body"].read()
+        sz = len(data)
+        buf[:sz] = data
+        self.position += sz
+        return sz
+
+class ZipArchive(TransferWorker):
+    Defaults = {
+        "manifest": None,
+        "processes": None,
+        "level": zlib.Z_DEFAULT_COMPRESSION,
+        "spool_limit": 2 ** 20,
+        # pools can't be started from daemonic processes
+        "daemon": False,
+    }
+
+    def transfer(self):
+        processes = self.processes or multiprocessing.cpu_count()
+        window = processes * 2
+        spool_dir = tempfile.mkdtemp(prefix="sabot-zip-")
+        pool = multiprocessing.Pool(processes)
+        zw = zipstream.ZipStreamWriter(self)
+        pending = collections.deque()
+        try:
+            for (path, arcname) in self.manifest:
+                st = os.lstat(path)
+                if stat.S_ISDIR(st.st_mode):
+                    pending.append((arcname, st, None))
+                elif stat.S_ISLNK(st.st_mode):
+                    pending.append((arcname, st, os.readlink(path)))
+                elif stat.S_ISREG(st.st_mode):
+                    args = (path, self.level, self.bufsize, self.spool_limit, spool_dir)
+                    pending.append((arcname, st, pool.apply_async(zipstream.compress_member, args)))
+                else:
+                    logger.warning("skipping special file %s" % path)
+                    continue
+                # keep a bounded number of members in flight, written in manifest order
+                while len(pending) > window:
+                    self.write_member(zw, *pending.popleft())
+            while pending:
+                self.write_member(zw, *pending.popleft())
+            zw.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    def write_member(self, zw, arcname, st, result):
+        if stat.S_ISDIR(st.st_mode):
+            zw.add_directory(arcname, st)
+            return
+        if stat.S_ISLNK(st.st_mode):
+            zw.add_symlink(arcname, st, result)
+            return
+        member = result.get()
+        if member["spool"] == None:
+            zw.add_file(arcname, st, member, [member["data"]])
+            return
+        try:
+            with open(member["spool"], "rb") as fh:
+                chunks = iter(lambda: fh.read(self.bufsize), b"")
+                zw.add_file(arcname, st, member, chunks)
+        finally:
+            os.unlink(member["spool"])
+
+class ZipExtract(TransferWorker):
+    RandomAccess = True
+
+    Defaults = {
+        "path": ".",
+        "s3obj": None,
+        "processes": None,
+        "range_size": 2 ** 23,
+        "daemon": False,
+    }
+
+    def transfer(self):
+        spool = None
+        if self.s3obj != None:
+            source = ("s3", self.s3obj.bucket_name, self.s3obj.key, self.range_size, s3_endpoint(self.s3obj))
+        else:
+            # a pipe can't seek, so land it on disk to reach the central directory
+            spool = tempfile.NamedTemporaryFile(prefix="sabot-zip-", delete=False)
+            with spool:
+                while 1:
+                    data = self.read()
+                    if not data:
+                        break
+                    spool.write(data)
+            source = ("file", spool.name)
+        try:
+            self.extract(source)
+        finally:
+            if spool != None:
+                os.unlink(spool.name)
+
+    def extract(self, source):
+        zf = zipfile.ZipFile(open_source(source))
+        try:
+            # make directories here, concurrent makedirs in the pool would race
+            infos = []
+            links = []
+            for info in zf.infolist():
+                if member_target(self.path, info.filename) == None:
+                    logger.warning("refusing zip member outside %s: %s" % (self.path, info.filename))
+                elif info.filename.endswith("/"):
+                    zf.extract(info, path=self.path)
+                elif stat.S_ISLNK(info.external_attr >> 16):
+                    linkname = zf.read(info)
+                    if str is not bytes:
+                        linkname = linkname.decode("utf-8", "surrogateescape")
+                    links.append((info.filename, linkname))
+                else:
+                    infos.append(info)
+        finally:
+            zf.close()
+        processes = self.processes or multiprocessing.cpu_count()
+        processes = max(1, min(processes, len(infos)))
+        # greedy balance of compressed bytes across the pool
+        buckets = [[0, []] for idx in range(processes)]
+        for info in sorted(infos, key=lambda info: info.compress_size, reverse=True):
+            bucket = min(buckets, key=lambda bucket: bucket[0])
+            bucket[0] += info.compress_size
+            bucket[1].append(info.filename)
+        pool = multiprocessing.Pool(processes, initializer=self.prewarm)
+        try:
+            results = [pool.apply_async(extract_members, (source, names, self.path)) for (size, names) in buckets]
+            for result in results:
+                result.get()
+        finally:
+            pool.terminate()
+            pool.join()
+        # symlinks go last so none of them can redirect a member written above
+        extract_symlinks(links, self.path)
+
 class GzipArchive(TransferWorker):
     def transfer(self):
         engine = zlib.compressobj()
@@ -296,51 +609,245 @@ class Bzip2Extract(TransferWorker):
                 break
             self.write(engine.decompress(data))
 
-class FileReaderWorker(TransferWorker):
+class FileWorker(TransferWorker):
     Defaults = {
         "path": None,
-        "mode": "rb",
+        "direct": False,
+        "drop_cache": False,
+        "drop_interval": 2 ** 24,
     }
 
+    # set by the transfer method that actually ran: buffered, mmap or direct
+    transfer_mode = None
+
     def transfer(self):
+        if self.drop_cache and not fileio.fadvise_supported():
+            logger.warning("posix_fadvise unavailable, drop_cache has no effect on %s" % self.path)
+        method = self.get_transfer()
+        method()
+
+    def use_direct(self):
+        if not self.direct:
+            return False
+        if not fileio.direct_supported():
+            logger.warning("O_DIRECT unavailable on this platform, using buffered io for %s" % self.path)
+            return False
+        return True
+
+    def open_direct(self, flags):
+        try:
+            return os.open(self.path, flags | fileio.O_DIRECT, 0o666)
+        except OSError as err:
+            # some filesystems (tmpfs, overlayfs) refuse O_DIRECT
+            if err.errno != errno.EINVAL:
+                raise
+            logger.warning("O_DIRECT not supported for %s, using buffered io" % self.path)
+            return None
+
+    def is_regular(self, fd):
+        # pipes and devices have no page cache to manage, hints on them fail with ESPIPE
+        return stat.S_ISREG(os.fstat(fd).st_mode)
+
+    def advise(self, fd, offset, length, advice):
+        if self.is_regular(fd):
+            fileio.fadvise(fd, offset, length, advice)
+
+    def drop_pages(self, fd, offset, length):
+        if not self.drop_cache or length <= 0:
+            return
+        # the kernel only drops whole pages, so widen the range to the page boundary
+        start = offset - offset % mmap.PAGESIZE
+        self.advise(fd, start, length + offset - start, fileio.POSIX_FADV_DONTNEED)
+
+    def drop_file(self, fd):
+        # large folios straddling interval boundaries only go with a whole-file drop
+        if self.drop_cache:
+            self.advise(fd, 0, 0, fileio.POSIX_FADV_DONTNEED)
+
+class FileReaderWorker(FileWorker):
+    Defaults = {
+        "mode": "rb",
+        "mmap": False,
+    }
+
+    def get_transfer(self):
+        if self.mmap:
+            return self.transfer_mmap
+        if self.use_direct():
+            return self.transfer_direct
+        return self.transfer_buffered
+
+    def transfer_buffered(self):
+        self.transfer_mode = "buffered"
         with open(self.path, self.mode) as fh:
+            fd = fh.fileno()
+            self.advise(fd, 0, 0, fileio.POSIX_FADV_SEQUENTIAL)
+            offset = 0
+            dropped = 0
             while 1:
                 data = fh.read(self.bufsize)
                 if not data:
                     break
                 self.write(data)
+                offset += len(data)
+                if offset - dropped >= self.drop_interval:
+                    self.drop_pages(fd, dropped, offset - dropped)
+                    dropped = offset
+            self.drop_file(fd)
+
+    def transfer_mmap(self):
+        self.transfer_mode = "mmap"
+        bufsize = fileio.align(self.bufsize)
+        # map a window at a time; pages can only leave the cache once unmapped
+        window = fileio.align(max(self.drop_interval, bufsize), mmap.ALLOCATIONGRANULARITY)
+        with open(self.path, "rb") as fh:
+            fd = fh.fileno()
+            size = os.fstat(fd).st_size
+            self.advise(fd, 0, 0, fileio.POSIX_FADV_SEQUENTIAL)
+            for start in range(0, size, window):
+                length = min(window, size - start)
+                mm = mmap.mmap(fd, length, access=mmap.ACCESS_READ, offset=start)
+                try:
+                    self.write_mapped(mm, bufsize)
+                finally:
+                    mm.close()
+                self.drop_pages(fd, start, length)
+            self.drop_file(fd)
+
+    def write_mapped(self, mm, bufsize):
+        try:
+            view = memoryview(mm)
+        except TypeError:
+            # python 2 mmaps only expose the old buffer interface, which file.write takes as is
+            for offset in range(0, len(mm), bufsize):
+                self.write(buffer(mm, offset, bufsize))
+            return
+        try:
+            for offset in range(0, len(mm), bufsize):
+                self.write(view[offset:offset + bufsize])
+        finally:
+            view.release()
+
+    def transfer_direct(self):
+        fd = self.open_direct(os.O_RDONLY)
+        if fd == None:
+            return self.transfer_buffered()
+        self.transfer_mode = "direct"
+        buf = fileio.AlignedBuffer(self.bufsize)
+        try:
+            while 1:
+                sz = buf.readfrom(fd)
+                if not sz:
+                    break
+                self.write(buf.getvalue(sz))
+        finally:
+            os.close(fd)
 
-class FileWriterWorker(TransferWorker):
+class FileWriterWorker(FileWorker):
     Defaults = {
-        "path": None,
         "mode": "wb",
+        "preallocate": None,
     }
 
-    def transfer(self):
+    def get_transfer(self):
+        if self.use_direct():
+            if self.mode == "wb":
+                return self.transfer_direct
+            logger.warning("O_DIRECT needs mode 'wb', using buffered io for %s" % self.path)
+        return self.transfer_buffered
+
+    def preallocate_file(self, fd, offset):
+        if not self.preallocate:
+            return
+        if not fileio.fallocate(fd, offset, self.preallocate):
+            logger.warning("posix_fallocate unavailable, not preallocating %s" % self.path)
+
+    def transfer_buffered(self):
+        self.transfer_mode = "buffered"
         with open(self.path, self.mode) as fh:
+            fd = fh.fileno()
+            regular = self.is_regular(fd)
+            offset = fh.tell() if regular else 0
+            self.preallocate_file(fd, offset)
+            drop = self.drop_cache and regular
+            synced = offset
             while 1:
                 data = self.read()
                 if not data:
                     break
                 fh.write(data)
+                offset += len(data)
+                if drop and offset - synced >= self.drop_interval:
+                    # dirty pages have to reach the disk before they can be dropped
+                    fh.flush()
+                    os.fdatasync(fd)
+                    self.drop_pages(fd, synced, offset - synced)
+                    synced = offset
+            fh.flush()
+            if self.preallocate and regular:
+                fh.truncate(offset)
+            if drop:
+                os.fdatasync(fd)
+                self.drop_file(fd)
+
+    def transfer_direct(self):
+        fd = self.open_direct(os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        if fd == None:
+            return self.transfer_buffered()
+        self.transfer_mode = "direct"
+        buf = fileio.AlignedBuffer(self.bufsize)
+        fill = 0
+        total = 0
+        try:
+            self.preallocate_file(fd, 0)
+            while 1:
+                data = self.read()
+                if not data:
+                    break
+                pos = 0
+                while pos < len(data):
+                    sz = min(len(data) - pos, buf.size - fill)
+                    buf.put(fill, data[pos:pos + sz])
+                    pos += sz
+                    fill += sz
+                    if fill == buf.size:
+                        buf.writeto(fd, fill)
+                        total += fill
+                        fill = 0
+            if fill:
+                # the tail isn't block aligned, so finish it with buffered io
+                fileio.clear_direct(fd)
+                buf.writeto(fd, fill)
+                total += fill
+            os.ftruncate(fd, total)
+        finally:
+            os.close(fd)
 
-class S3UploadWorker(TransferWorker):
+class S3Worker(TransferWorker):
     Defaults = {
         "s3obj": None,
         "ExtraArgs": None,
     }
 
-    def transfer(self):
-        self.s3obj.upload_fileobj(self.pipe_read, ExtraArgs=self.ExtraArgs, Callback=self.transfer_callback)
+    def __init__(self, **kw):
+        super(S3Worker, self).__init__(**kw)
+        self.endpoint = s3_endpoint(self.s3obj) if self.s3obj != None else {}
 
-class S3DownloadWorker(TransferWorker):
-    Defaults = {
-        "s3obj": None,
-        "ExtraArgs": None,
-    }
+    def get_object(self):
+        # s3obj holds the parent's client, rebuild it on this process's cached resource
+        from . import session
+        s3 = session.resource("s3", **self.endpoint)
+        return s3.Object(self.s3obj.bucket_name, self.s3obj.key)
+
+class S3UploadWorker(S3Worker):
+    def transfer(self):
+        s3obj = self.get_object()
+        s3obj.upload_fileobj(self.pipe_read, ExtraArgs=self.ExtraArgs, Callback=self.transfer_callback)
 
+class S3DownloadWorker(S3Worker):
     def transfer(self):
-        self.s3obj.download_fileobj(self.pipe_write, ExtraArgs=self.ExtraArgs, Callback=self.transfer_callback)
+        s3obj = self.get_object()
+        s3obj.download_fileobj(self.pipe_write, ExtraArgs=self.ExtraArgs, Callback=self.transfer_callback)
 
 class TransferFactory(object):
     ArchiveChainMap = {
@@ -351,19 +858,19 @@ class TransferFactory(object):
         'tbz2': ('tar', 'bz2'),
         'gz': ('gz',),
         'bz2': ('bz2',),
-        'zip': ('zip'),
+        'zip': ('zip',),
     }
     ArchiveMap = {
         "tar": TarArchive,
         "gz": GzipArchive,
         "bz2": Bzip2Archive,
-        "zip": None,
+        "zip": ZipArchive,
     }
     ExtractMap = {
         "tar": TarExtract,
         "gz": GzipExtract,
         "bz2": Bzip2Extract,
-        "zip": None,
+        "zip": ZipExtract,
     }
 
     def extract_chain(self, archive=None, **kw):
@@ -386,8 +893,8 @@ class TransferFactory(object):
         chain = [self.ArchiveMap[cn](**kw) for cn in cart]
         return chain
 
-    def upload(self, path=None, manifest=None, s3obj=None, relpath=None, arcpath=None, archive=None, **kw):
-        if path and manifest:
+    def upload(self, path=None, manifest=None, s3obj=None, relpath=None, arcpath=None, archive=None, prewarm=None, **kw):
+        if path and manifest != None:
             raise ValueError("You can only specify a path or a manifest")
         if path:
             if not os.path.exists(path):
@@ -396,31 +903,34 @@ class TransferFactory(object):
                 if not recursive:
                     raise ValueError("uploading directories requires recursive flag")
                 manifest = Manifest(path, relpath=relpath, arcpath=arcpath)
+            elif archive == "zip":
+                manifest = Manifest(path, relpath=os.path.dirname(path), arcpath=arcpath)
             else:
                 archive = archive if archive != None else "bz2"
-                chain = self.archive_chain(archive)
-                chain = [FileReaderWorker(path=path)] + chain
-        if manifest:
+                chain = self.archive_chain(archive, prewarm=prewarm)
+                chain = [FileReaderWorker(path=path, prewarm=prewarm)] + chain
+        if manifest != None:
             archive = archive if archive != None else "tar.bz2"
-            chain = self.archive_chain(archive, manifest=manifest)
+            chain = self.archive_chain(archive, manifest=manifest, prewarm=prewarm)
         extra = {
             "Metadata": {
                 "__manifest__": str((manifest != None)),
                 "__archive__": str(archive),
             }
         }
-        chain = chain + [S3UploadWorker(s3obj=s3obj, ExtraArgs=extra)]
+        chain = chain + [S3UploadWorker(s3obj=s3obj, ExtraArgs=extra, prewarm=prewarm)]
         tm = TransferManager(*chain)
         tm.start()
         return tm
             
-    def download(self, s3obj=None, archive=None, **kw):
+    def download(self, s3obj=None, archive=None, prewarm=None, **kw):
         archive = archive if archive != None else s3obj.metadata.get("__archive__", None)
         manifest_flag = s3obj.metadata.get("__manifest__", False)
-        chain = self.extract_chain(archive, **kw)
-        chain = [S3DownloadWorker(s3obj=s3obj)] + chain
+        chain = self.extract_chain(archive, s3obj=s3obj, prewarm=prewarm, **kw)
+        if not (chain and chain[0].RandomAccess):
+            chain = [S3DownloadWorker(s3obj=s3obj, prewarm=prewarm)] + chain
         if not manifest_flag or not archive:
-            chain = chain + [FileWriterWorker(**kw)]
+            chain = chain + [FileWriterWorker(prewarm=prewarm, **kw)]
         tm = TransferManager(*chain)
         tm.start()
         return tm
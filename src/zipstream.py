@@ -0,0 +1,248 @@
+import os
+import stat
+import struct
+import tempfile
+import time
+import zlib
+
+__all__ = ["ZipStreamWriter", "compress_member"]
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_COUNT_LIMIT = 0xFFFF
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+CREATE_SYSTEM_UNIX = 3
+
+LocalHeader = struct.Struct("<IHHHHHIIIHH")
+DataDescriptor = struct.Struct("<IIII")
+DataDescriptor64 = struct.Struct("<IIQQ")
+CentralHeader = struct.Struct("<IHHHHHHIIIHHHHHII")
+EndRecord = struct.Struct("<IHHHHIIH")
+EndRecord64 = struct.Struct("<IQHHIIQQQQ")
+EndLocator64 = struct.Struct("<IIQI")
+
+SIG_LOCAL = 0x04034b50
+SIG_DESCRIPTOR = 0x08074b50
+SIG_CENTRAL = 0x02014b50
+SIG_END = 0x06054b50
+SIG_END64 = 0x06064b50
+SIG_LOCATOR64 = 0x07064b50
+
+def dos_datetime(mtime):
+    tm = time.localtime(mtime)
+    if tm.tm_year < 1980:
+        return (0, (1 << 5) | 1)
+    dtime = (tm.tm_hour << 11) | (tm.tm_min << 5) | (tm.tm_sec // 2)
+    ddate = ((tm.tm_year - 1980) << 9) | (tm.tm_mon << 5) | tm.tm_mday
+    return (dtime, ddate)
+
+def encode_name(name):
+    if isinstance(name, bytes):
+        return name
+    return name.encode("utf-8")
+
+def compress_member(path, level=zlib.Z_DEFAULT_COMPRESSION, bufsize=2 ** 16, spool_limit=2 ** 20, spool_dir=None):
+    """
+    Deflate a single file, returning its crc, sizes and compressed payload.
+    Small payloads are returned inline, larger ones are spooled to a
+    temporary file so pool results stay bounded in memory.  Runs in a pool
+    worker, so it only takes and returns picklable values.
+    """
+    engine = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = 0
+    file_size = 0
+    compress_size = 0
+    chunks = []
+    spool = None
+
+    def emit(data):
+        if spool != None:
+            spool.write(data)
+        else:
+            chunks.append(data)
+
+    try:
+        with open(path, "rb") as fh:
+            while 1:
+                data = fh.read(bufsize)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+                file_size += len(data)
+                output = engine.compress(data)
+                compress_size += len(output)
+                emit(output)
+                if spool == None and compress_size > spool_limit:
+                    spool = tempfile.NamedTemporaryFile(dir=spool_dir, delete=False)
+                    spool.write(b"".join(chunks))
+                    chunks = []
+        output = engine.flush()
+        compress_size += len(output)
+        emit(output)
+    finally:
+        if spool != None:
+            spool.close()
+    member = {
+        "crc": crc & 0xFFFFFFFF,
+        "file_size": file_size,
+        "compress_size": compress_size,
+        "data": None,
+        "spool": None,
+    }
+    if spool != None:
+        member["spool"] = spool.name
+    else:
+        member["data"] = b"".join(chunks)
+    return member
+
+class ZipStreamWriter(object):
+    """
+    Writes a zip archive to a forward-only stream.  Members arrive
+    precompressed; every file is followed by a data descriptor, symlinks
+    store their target as content, and the central directory is emitted
+    on close().  Zip64 records are only used when a member, offset or
+    entry count needs them.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self.entries = []
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def add_directory(self, arcname, st):
+        name = encode_name(arcname.rstrip("/") + "/")
+        entry = {
+            "name": name,
+            "flags": FLAG_UTF8,
+            "method": ZIP_STORED,
+            "datetime": dos_datetime(st.st_mtime),
+            "crc": 0,
+            "file_size": 0,
+            "compress_size": 0,
+            "external_attr": ((st.st_mode & 0xFFFF) << 16) | 0x10,
+            "offset": self.offset,
+        }
+        self._write_local_header(entry)
+        self.entries.append(entry)
+
+    def add_symlink(self, arcname, st, target):
+        target = encode_name(target)
+        entry = {
+            "name": encode_name(arcname),
+            "flags": FLAG_UTF8,
+            "method": ZIP_STORED,
+            "datetime": dos_datetime(st.st_mtime),
+            "crc": zlib.crc32(target) & 0xFFFFFFFF,
+            "file_size": len(target),
+            "compress_size": len(target),
+            "external_attr": (stat.S_IFLNK | 0o777) << 16,
+            "offset": self.offset,
+        }
+        self._write_local_header(entry)
+        self._write(target)
+        self.entries.append(entry)
+
+    def add_file(self, arcname, st, member, chunks):
+        """
+        Emit a file entry.  `member` is the result of compress_member(),
+        `chunks` iterates over its compressed payload.
+        """
+        entry = {
+            "name": encode_name(arcname),
+            "flags": FLAG_UTF8 | FLAG_DATA_DESCRIPTOR,
+            "method": ZIP_DEFLATED,
+            "datetime": dos_datetime(st.st_mtime),
+            "crc": member["crc"],
+            "file_size": member["file_size"],
+            "compress_size": member["compress_size"],
+            "external_attr": (stat.S_IFREG | stat.S_IMODE(st.st_mode)) << 16,
+            "offset": self.offset,
+        }
+        self._write_local_header(entry)
+        for data in chunks:
+            self._write(data)
+        zip64 = self._needs_zip64(entry)
+        if zip64:
+            descriptor = DataDescriptor64.pack(SIG_DESCRIPTOR, entry["crc"], entry["compress_size"], entry["file_size"])
+        else:
+            descriptor = DataDescriptor.pack(SIG_DESCRIPTOR, entry["crc"], entry["compress_size"], entry["file_size"])
+        self._write(descriptor)
+        self.entries.append(entry)
+
+    def _needs_zip64(self, entry):
+        return entry["file_size"] >= ZIP64_LIMIT or entry["compress_size"] >= ZIP64_LIMIT
+
+    def _write_local_header(self, entry):
+        extra = b""
+        version = VERSION_DEFAULT
+        crc = file_size = compress_size = 0
+        if not entry["flags"] & FLAG_DATA_DESCRIPTOR:
+            crc = entry["crc"]
+            file_size = entry["file_size"]
+            compress_size = entry["compress_size"]
+        if self._needs_zip64(entry):
+            # sizes live in the zip64 extra field and the descriptor is 64-bit
+            version = VERSION_ZIP64
+            file_size = compress_size = ZIP64_LIMIT
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+        (dtime, ddate) = entry["datetime"]
+        header = LocalHeader.pack(SIG_LOCAL, version, entry["flags"], entry["method"], dtime, ddate,
+                                  crc, compress_size, file_size, len(entry["name"]), len(extra))
+        self._write(header)
+        self._write(entry["name"])
+        self._write(extra)
+
+    def _write_central_header(self, entry):
+        fields = []
+        file_size = entry["file_size"]
+        compress_size = entry["compress_size"]
+        offset = entry["offset"]
+        if file_size >= ZIP64_LIMIT:
+            fields.append(file_size)
+            file_size = ZIP64_LIMIT
+        if compress_size >= ZIP64_LIMIT:
+            fields.append(compress_size)
+            compress_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = b""
+        version = VERSION_DEFAULT
+        if fields:
+            version = VERSION_ZIP64
+            extra = struct.pack("<HH%dQ" % len(fields), 1, 8 * len(fields), *fields)
+        (dtime, ddate) = entry["datetime"]
+        header = CentralHeader.pack(SIG_CENTRAL, (CREATE_SYSTEM_UNIX << 8) | version, version,
+                                    entry["flags"], entry["method"], dtime, ddate, entry["crc"],
+                                    compress_size, file_size, len(entry["name"]), len(extra), 0,
+                                    0, 0, entry["external_attr"], offset)
+        self._write(header)
+        self._write(entry["name"])
+        self._write(extra)
+
+    def close(self):
+        cd_offset = self.offset
+        for entry in self.entries:
+            self._write_central_header(entry)
+        cd_size = self.offset - cd_offset
+        count = len(self.entries)
+        if count >= ZIP_COUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            end64_offset = self.offset
+            self._write(EndRecord64.pack(SIG_END64, EndRecord64.size - 12, (CREATE_SYSTEM_UNIX << 8) | VERSION_ZIP64,
+                                         VERSION_ZIP64, 0, 0, count, count, cd_size, cd_offset))
+            self._write(EndLocator64.pack(SIG_LOCATOR64, 0, end64_offset, 1))
+            count = min(count, ZIP_COUNT_LIMIT)
+            cd_size = min(cd_size, ZIP64_LIMIT)
+            cd_offset = min(cd_offset, ZIP64_LIMIT)
+        self._write(EndRecord.pack(SIG_END, 0, 0, count, count, cd_size, cd_offset, 0))
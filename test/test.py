@@ -1,14 +1,23 @@
 #!/usr/bin/env python
 
 import os
+import sys
 import shutil
+import stat
+import subprocess
+import functools
+import multiprocessing
 import unittest
 import uuid
 import random
 import filecmp
+import tarfile
+import zipfile
 
 import boto3
 from sabot import transfer
+from sabot import index as index_module
+from sabot import fileio
 import sabot
 
 def random_tag():
@@ -73,6 +82,409 @@ class MockDirectory(object):
             cmd = random.choice(opts)
             getattr(self, cmd)()
 
+class MemoryPipe(object):
+    def __init__(self, payload=b"", bufsize=2 ** 16):
+        self.chunks = [payload[i:i + bufsize] for i in range(0, len(payload), bufsize)]
+        self.written = []
+        self.types = set()
+
+    def read(self, bufsize=None):
+        return self.chunks.pop(0) if self.chunks else b""
+
+    def write(self, data):
+        self.types.add(type(data))
+        self.written.append(bytes(data))
+
+    def getvalue(self):
+        return b"".join(self.written)
+
+def direct_io_works(root="/tmp"):
+    path = os.path.join(root, random_tag())
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | fileio.O_DIRECT)
+    except OSError:
+        return False
+    os.close(fd)
+    os.unlink(path)
+    return fileio.direct_supported()
+
+class Test_FileWorkers(unittest.TestCase):
+    def setUp(self):
+        self.src = os.path.join("/tmp", random_tag())
+        self.dst = os.path.join("/tmp", random_tag())
+        self.payload = os.urandom(2 ** 20 + 123)
+        with open(self.src, 'wb') as fh:
+            fh.write(self.payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def tearDown(self):
+        for path in (self.src, self.dst):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def roundtrip(self, reader_kw, writer_kw):
+        reader = transfer.FileReaderWorker(path=self.src, **reader_kw)
+        writer = transfer.FileWriterWorker(path=self.dst, **writer_kw)
+        tm = transfer.TransferManager(reader, writer)
+        tm.start()
+        tm.join()
+        with open(self.dst, 'rb') as fh:
+            self.assertEqual(fh.read(), self.payload)
+
+    def read_local(self, **kw):
+        reader = transfer.FileReaderWorker(path=self.src, **kw)
+        pipe = MemoryPipe()
+        reader.endpoint_bind(write=pipe)
+        reader.transfer()
+        self.assertEqual(pipe.getvalue(), self.payload)
+        reader.written_types = pipe.types
+        return reader
+
+    def write_local(self, **kw):
+        writer = transfer.FileWriterWorker(path=self.dst, **kw)
+        writer.endpoint_bind(read=MemoryPipe(self.payload, 70001))
+        writer.transfer()
+        return writer
+
+    def assertWritten(self):
+        with open(self.dst, 'rb') as fh:
+            self.assertEqual(fh.read(), self.payload)
+
+    def test_buffered(self):
+        self.roundtrip({"drop_cache": True}, {"drop_cache": True})
+
+    def test_mmap(self):
+        self.roundtrip({"mmap": True, "drop_cache": True}, {"preallocate": 2 ** 21})
+        reader = self.read_local(mmap=True, drop_interval=2 ** 18)
+        self.assertEqual(reader.transfer_mode, "mmap")
+        # chunks are views of the mapping, never copies
+        self.assertFalse(bytes in reader.written_types)
+
+    def test_direct(self):
+        if not direct_io_works():
+            self.skipTest("O_DIRECT unsupported here")
+        self.roundtrip({"direct": True}, {"direct": True})
+        self.assertEqual(self.read_local(direct=True).transfer_mode, "direct")
+        self.assertEqual(self.write_local(direct=True).transfer_mode, "direct")
+        self.assertWritten()
+
+    def test_drop_cache(self):
+        if not fileio.fadvise_supported() or fileio.cached_pages(self.src) == None:
+            self.skipTest("posix_fadvise or mincore unsupported here")
+        for kw in ({}, {"mmap": True}):
+            self.read_local(**kw)
+            self.read_local(drop_cache=True, drop_interval=2 ** 18, **kw)
+            (cached, total) = fileio.cached_pages(self.src)
+            self.assertEqual(cached, 0)
+        self.write_local(drop_cache=True, drop_interval=2 ** 18)
+        (cached, total) = fileio.cached_pages(self.dst)
+        self.assertEqual(cached, 0)
+        self.assertWritten()
+
+    def test_fifo(self):
+        fifo = os.path.join("/tmp", random_tag())
+        os.mkfifo(fifo)
+        try:
+            feeder = multiprocessing.Process(target=feed_fifo, args=(fifo, self.payload))
+            feeder.start()
+            reader = transfer.FileReaderWorker(path=fifo, drop_cache=True, drop_interval=2 ** 18)
+            pipe = MemoryPipe()
+            reader.endpoint_bind(write=pipe)
+            reader.transfer()
+            feeder.join()
+            self.assertEqual(pipe.getvalue(), self.payload)
+            queue = multiprocessing.Queue()
+            drainer = multiprocessing.Process(target=drain_fifo, args=(fifo, queue))
+            drainer.start()
+            writer = transfer.FileWriterWorker(path=fifo, drop_cache=True, drop_interval=2 ** 18)
+            writer.endpoint_bind(read=MemoryPipe(self.payload, 70001))
+            writer.transfer()
+            self.assertEqual(queue.get(), self.payload)
+            drainer.join()
+        finally:
+            os.unlink(fifo)
+
+    def test_preallocate(self):
+        if not fileio.fallocate_supported():
+            self.skipTest("posix_fallocate unsupported here")
+        self.write_local(preallocate=2 ** 22)
+        self.assertWritten()
+        self.assertEqual(os.stat(self.dst).st_size, len(self.payload))
+
+def feed_fifo(path, payload):
+    with open(path, 'wb') as fh:
+        fh.write(payload)
+
+def drain_fifo(path, queue):
+    with open(path, 'rb') as fh:
+        queue.put(fh.read())
+
+def client_is_inherited(parent_client_id):
+    from sabot import session
+    return id(session.client("s3")) == parent_client_id
+
+def touch(path):
+    open(path, 'w').close()
+
+class Test_Session(unittest.TestCase):
+    def test_import_is_lazy(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        code = "import sys, sabot; sys.stdout.write(str('boto3' in sys.modules))"
+        output = subprocess.check_output([sys.executable, "-c", code], env=env)
+        self.assertEqual(output.strip(), b"False")
+
+    def test_hooks_cached(self):
+        from sabot import hooks
+        self.assertTrue(hooks.get_hooks())
+        self.assertTrue(hooks.get_hooks() is hooks.get_hooks())
+
+    def test_client_per_process(self):
+        from sabot import session
+        cli = session.client("s3")
+        self.assertTrue(session.client("s3") is cli)
+        pool = multiprocessing.Pool(1)
+        try:
+            self.assertFalse(pool.apply(client_is_inherited, (id(cli),)))
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def test_s3_worker_uses_cached_resource(self):
+        from sabot import session
+        s3obj = sabot.resource("s3").Object(random_tag(), random_tag())
+        worker = transfer.S3UploadWorker(s3obj=s3obj)
+        obj = worker.get_object()
+        self.assertEqual((obj.bucket_name, obj.key), (s3obj.bucket_name, s3obj.key))
+        self.assertTrue(obj.meta.client is session.resource("s3", **worker.endpoint).meta.client)
+        self.assertTrue(worker.get_object().meta.client is obj.meta.client)
+
+    def test_s3_worker_keeps_endpoint(self):
+        from sabot import session
+        endpoint = "http://localhost:9000"
+        s3 = sabot.get_session().resource("s3", endpoint_url=endpoint, region_name="eu-west-1")
+        s3obj = s3.Object(random_tag(), random_tag())
+        meta = transfer.S3DownloadWorker(s3obj=s3obj).get_object().meta.client.meta
+        self.assertEqual((meta.endpoint_url, meta.region_name), (endpoint, "eu-west-1"))
+        self.assertFalse(session.client("s3", endpoint_url=endpoint) is session.client("s3"))
+
+    def test_prewarm_runs_in_worker(self):
+        src = os.path.join("/tmp", random_tag())
+        dst = os.path.join("/tmp", random_tag())
+        marker = os.path.join("/tmp", random_tag())
+        try:
+            touch(src)
+            prewarm = functools.partial(touch, marker)
+            tm = transfer.TransferManager(
+                transfer.FileReaderWorker(path=src, prewarm=prewarm),
+                transfer.FileWriterWorker(path=dst))
+            tm.start()
+            tm.join()
+            self.assertTrue(os.path.exists(marker))
+        finally:
+            for path in (src, dst, marker):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+class Test_Zip(unittest.TestCase):
+    def setUp(self):
+        self.mock = MockDirectory()
+        # random data doesn't compress, so this member is spooled to disk
+        self.large = os.path.join(self.mock.root, "large")
+        with open(self.large, 'wb') as fh:
+            fh.write(os.urandom(2 ** 21))
+        self.dangling = os.path.join(self.mock.root, "dangling")
+        os.symlink(random_tag(), self.dangling)
+        self.zippath = os.path.join("/tmp", random_tag() + ".zip")
+        self.downpath = os.path.join("/tmp", random_tag())
+
+    def tearDown(self):
+        if os.path.exists(self.zippath):
+            os.unlink(self.zippath)
+        if os.path.exists(self.downpath):
+            shutil.rmtree(self.downpath)
+
+    def archive(self):
+        tm = transfer.TransferManager(
+            transfer.ZipArchive(manifest=self.mock.manifest, processes=4, spool_limit=2 ** 16),
+            transfer.FileWriterWorker(path=self.zippath))
+        tm.start()
+        tm.join()
+
+    def test_archive(self):
+        self.archive()
+        zf = zipfile.ZipFile(self.zippath)
+        try:
+            self.assertEqual(zf.testzip(), None)
+            names = set(zf.namelist())
+            for (path, arcname) in self.mock.manifest:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    arcname += "/"
+                self.assertTrue(arcname in names)
+            with open(self.large, 'rb') as fh:
+                self.assertEqual(zf.read("large"), fh.read())
+            self.assertEqual(zf.read("dangling"), os.readlink(self.dangling).encode())
+        finally:
+            zf.close()
+
+    def test_extract(self):
+        self.archive()
+        for attempt in range(5):
+            tm = transfer.TransferManager(
+                transfer.FileReaderWorker(path=self.zippath),
+                transfer.ZipExtract(path=self.downpath, processes=4))
+            tm.start()
+            tm.join()
+            self.assertEqual(tm[-1].exitcode, 0)
+            self.assertTrue(self.mock.compare(self.downpath))
+            self.assertTrue(filecmp.cmp(self.large, os.path.join(self.downpath, "large"), shallow=False))
+            self.assertEqual(os.readlink(os.path.join(self.downpath, "dangling")), os.readlink(self.dangling))
+            shutil.rmtree(self.downpath)
+
+    def test_extract_symlink_escape(self):
+        outside = os.path.join("/tmp", random_tag())
+        os.mkdir(outside)
+        zf = zipfile.ZipFile(self.zippath, "w")
+        try:
+            links = [("ln", outside + "/"), ("abs", "/etc/passwd"), ("esc", "../../etc/passwd"), ("good", "sub/file")]
+            for (name, linkname) in links:
+                info = zipfile.ZipInfo(name)
+                info.external_attr = (stat.S_IFLNK | 0o777) << 16
+                zf.writestr(info, linkname)
+            zf.writestr("ln/pwned", b"pwned")
+            zf.writestr("sub/file", b"content")
+        finally:
+            zf.close()
+        try:
+            tm = transfer.TransferManager(
+                transfer.FileReaderWorker(path=self.zippath),
+                transfer.ZipExtract(path=self.downpath, processes=2))
+            tm.start()
+            tm.join()
+            self.assertEqual(tm[-1].exitcode, 0)
+            self.assertFalse(os.path.exists(os.path.join(outside, "pwned")))
+            self.assertFalse(os.path.islink(os.path.join(self.downpath, "ln")))
+            self.assertFalse(os.path.lexists(os.path.join(self.downpath, "abs")))
+            self.assertFalse(os.path.lexists(os.path.join(self.downpath, "esc")))
+            with open(os.path.join(self.downpath, "good"), 'rb') as fh:
+                self.assertEqual(fh.read(), b"content")
+        finally:
+            shutil.rmtree(outside)
+
+class Test_ManifestIndex(unittest.TestCase):
+    def test_index_matches_manifest(self):
+        mock = MockDirectory()
+        index = mock.manifest.index(chunk_size=7)
+        try:
+            self.assertEqual(sorted(index), sorted(mock.manifest))
+            self.assertEqual(len(index), len(list(mock.manifest)))
+        finally:
+            index.close()
+
+    def test_empty_tree(self):
+        root = os.path.join("/tmp", random_tag())
+        tarpath = os.path.join("/tmp", random_tag() + ".tar")
+        os.mkdir(root)
+        index = transfer.Manifest(root, relpath=root).index()
+        try:
+            self.assertEqual(len(index), 0)
+            self.assertEqual(list(index), [])
+            self.assertTrue(index)
+            tm = transfer.TransferManager(
+                transfer.TarArchive(manifest=index),
+                transfer.FileWriterWorker(path=tarpath))
+            tm.start()
+            tm.join()
+            tf = tarfile.open(tarpath)
+            try:
+                self.assertEqual(tf.getmembers(), [])
+            finally:
+                tf.close()
+        finally:
+            index.close()
+            os.rmdir(root)
+            if os.path.exists(tarpath):
+                os.unlink(tarpath)
+
+    def test_non_ascii_paths(self):
+        mock = MockDirectory()
+        name = u"caf\u00e9"
+        if str is bytes:
+            name = name.encode("utf-8")
+        with open(os.path.join(mock.root, name), 'wb') as fh:
+            fh.write(os.urandom(16))
+        filename = os.path.join("/tmp", random_tag())
+        index = mock.manifest.index(filename)
+        try:
+            reopened = index_module.ManifestIndex(filename)
+            self.assertEqual(sorted(reopened), sorted(mock.manifest))
+            for (path, arcname) in reopened:
+                self.assertTrue(type(path) is str and type(arcname) is str)
+        finally:
+            os.unlink(filename)
+
+    def test_diff(self):
+        mock = MockDirectory()
+        base = mock.manifest.index()
+        path = os.path.join(mock.root, random_tag())
+        with open(path, 'wb') as fh:
+            fh.write(os.urandom(16))
+        index = mock.manifest.index()
+        try:
+            added = [entry.path for (state, entry) in index.diff(base) if state == "added"]
+            self.assertEqual(len(added), 1)
+            changed = [pp for (pp, arcname) in index_module.IncrementalManifest(index, base)]
+            self.assertTrue(path in changed)
+        finally:
+            base.close()
+            index.close()
+
+class Test_TarArchive(unittest.TestCase):
+    def test_sparse_and_duplicates(self):
+        mock = MockDirectory()
+        sparse = os.path.join(mock.root, "sparse")
+        # more data segments than fit in the member header, and a trailing hole
+        with open(sparse, 'wb') as fh:
+            for idx in range(1, 10):
+                fh.seek(idx * 2 ** 20)
+                fh.write(os.urandom(16))
+            fh.truncate(2 ** 24)
+        payload = os.urandom(2 ** 13)
+        for name in ("dup1", "dup2"):
+            with open(os.path.join(mock.root, name), 'wb') as fh:
+                fh.write(payload)
+        tarpath = os.path.join("/tmp", random_tag() + ".tar")
+        downpath = os.path.join("/tmp", random_tag())
+        try:
+            tm = transfer.TransferManager(
+                transfer.TarArchive(manifest=mock.manifest, dedupe=True),
+                transfer.FileWriterWorker(path=tarpath))
+            tm.start()
+            tm.join()
+            tf = tarfile.open(tarpath)
+            try:
+                self.assertTrue(tf.getmember("sparse").issparse())
+                dup2 = tf.getmember("dup2")
+                self.assertEqual(dup2.type, tarfile.LNKTYPE)
+                self.assertEqual(dup2.linkname, "dup1")
+            finally:
+                tf.close()
+            self.assertTrue(os.path.getsize(tarpath) < 2 ** 20)
+            tm = transfer.TransferManager(
+                transfer.FileReaderWorker(path=tarpath),
+                transfer.TarExtract(path=downpath))
+            tm.start()
+            tm.join()
+            self.assertTrue(mock.compare(downpath))
+            for name in ("sparse", "dup1", "dup2"):
+                path = os.path.join(mock.root, name)
+                self.assertTrue(filecmp.cmp(path, os.path.join(downpath, name), shallow=False))
+        finally:
+            if os.path.exists(tarpath):
+                os.unlink(tarpath)
+            if os.path.exists(downpath):
+                shutil.rmtree(downpath)
+
 class Test_API(unittest.TestCase):
     @property
     def runid(self):
@@ -130,5 +542,22 @@ class Test_API(unittest.TestCase):
             if os.path.exists(downpath):
                 shutil.rmtree(downpath)
 
+    def test_zip_archive(self):
+        s3 = sabot.resource("s3")
+        mock = MockDirectory()
+        downpath = os.path.join("/tmp", random_tag())
+        key = random_tag()
+        try:
+            bucket_name = self.make_bucket()
+            s3obj = s3.Object(bucket_name, key)
+            s3obj.upload(manifest=mock.manifest, archive="zip").join()
+            s3obj.wait_until_exists()
+            s3obj.download(path=downpath).join()
+            self.assertTrue(mock.compare(downpath))
+        finally:
+            self.remove_bucket(bucket_name)
+            if os.path.exists(downpath):
+                shutil.rmtree(downpath)
+
 if __name__ == '__main__':
     unittest.main()